@@ -2,6 +2,9 @@
 
 import logging
 import sys
+
+import anyio
+
 from server import GmailMCPServer
 
 # Configure logging
@@ -17,9 +20,9 @@ def main():
         logger.info("Starting Gmail MCP server...")
         server = GmailMCPServer()
         
-        # Run the server
-        logger.info("Server initialized, starting on port 8000...")
-        server.run(host="0.0.0.0", port=8000)
+        # Run the server inside a top-level event loop
+        logger.info("Server initialized, starting on stdio...")
+        anyio.run(server.arun)
         
     except Exception as e:
         logger.error(f"Error running server: {str(e)}")
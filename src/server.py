@@ -3,31 +3,62 @@ Gmail MCP Server implementation.
 This module provides the core server functionality for Gmail integration using MCP.
 """
 
+import asyncio
 import base64
+import binascii
+import concurrent.futures
+import functools
 import os
-from email.mime.text import MIMEText
+import stat
+import threading
+import time
+from collections import OrderedDict, deque
+from email.header import Header
+from email.utils import formataddr, getaddresses
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Union
 
 import anyio
 
+import google_auth_httplib2
+import httplib2
 from dotenv import load_dotenv
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest, build_http
+from googleapiclient.model import JsonModel
 from google.auth.transport.requests import Request
 from mcp.server.fastmcp import FastMCP
 import logging
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+try:
+    from isal import isal_zlib
+except ImportError:  # isal is optional; httplib2 keeps using the stdlib zlib
+    isal_zlib = None
+else:
+    # httplib2 only uses zlib to decompress gzip/deflate responses, which
+    # ISA-L's drop-in module does considerably faster. Newer releases keep the
+    # decoders in httplib2.decode; both modules must agree on zlib.error.
+    for _module in (httplib2, getattr(httplib2, 'decode', None)):
+        if _module is not None:
+            _module.zlib = isal_zlib
+
 # Load environment variables
 load_dotenv()
 
 # Constants
-SCOPES = [
+SCOPES = (
     'https://www.googleapis.com/auth/gmail.modify',  # Read/write access (no delete)
     'https://www.googleapis.com/auth/gmail.compose',  # Create/send emails
     'https://www.googleapis.com/auth/gmail.readonly'  # Read-only access
-]
+)
 # Get the directory where the server.py script is located
 SCRIPT_DIR = Path(__file__).resolve().parent
 # Construct absolute paths relative to the script's directory
@@ -35,9 +66,306 @@ SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 TOKEN_PATH = PROJECT_ROOT / 'token.json'
 CREDENTIALS_PATH = PROJECT_ROOT / 'config/client_secret.json'
+TOKEN_PATH_STR = str(TOKEN_PATH)
+CREDENTIALS_PATH_STR = str(CREDENTIALS_PATH)
+# Whether token.json is known to exist; checked once at import and set after
+# every save, so the service cache never stats the disk per request
+_TOKEN_EXISTS = TOKEN_PATH.exists()
+# Gmail accepts at most 100 calls in a single batch request
+BATCH_SIZE = 100
+# MIME types that never hold a displayable message body
+NON_TEXT_MIME_PREFIXES = ('image/', 'application/', 'audio/', 'video/')
+# Number of extracted message bodies kept by get_email_content
+BODY_CACHE_SIZE = 128
+# Formatted list/search results are reused for this many seconds, so clients
+# polling the same view do not hit the API every time
+RESPONSE_CACHE_TTL = 2.0
+RESPONSE_CACHE_SIZE = 64
+# Encoded characters decoded per step; a multiple of 4 keeps chunks aligned
+DECODE_CHUNK_SIZE = 65532
+# Socket timeout, in seconds, for connections to the Gmail API
+HTTP_TIMEOUT = 30
+# Upper bound on concurrent API calls; sizes the handler worker pool and the
+# fan-out used when falling back from batch requests
+MAX_CONCURRENT_REQUESTS = 16
+# Largest page the Gmail list endpoints return
+MAX_PAGE_SIZE = 500
+# Most message IDs get_messages_batch accepts in one call
+MAX_BATCH_MESSAGE_IDS = 250
+
+# Separator printed after each formatted message or draft
+_SEP = '-' * 50
+# Per-item templates, formatted in one call with the extracted header values
+_format_message = (
+    "Message ID: {id}\nFrom: {from}\nTo: {to}\nDate: {date}\nSubject: {subject}\n" + _SEP + "\n"
+).format
+# Shown in place of a message that could not be fetched
+_format_error = ("Message ID: {id}\nError: {error}\n" + _SEP + "\n").format
+_format_draft = ("Draft ID: {id}\nTo: {to}\nSubject: {subject}\n" + _SEP + "\n").format
+# Fallback values by lowercased header name; Gmail does not guarantee casing
+_MESSAGE_DEFAULTS = {
+    'subject': 'No Subject',
+    'from': 'Unknown Sender',
+    'to': 'No Recipient',
+    'date': 'Unknown Date',
+}
+_DRAFT_DEFAULTS = {'subject': 'No Subject', 'to': 'No Recipient'}
+# Headers requested when fetching message metadata
+_META_HDRS = ('Subject', 'From', 'To', 'Date')
+# Maps the URL-safe base64 alphabet Gmail uses onto the standard one
+_URLSAFE_TRANS = bytes.maketrans(b'-_', b'+/')
 
 logger = logging.getLogger(__name__)
 
+
+def _extract_headers(headers: List[Dict[str, str]], defaults: Dict[str, str]) -> Dict[str, str]:
+    """Collect wanted header values in a single pass over the header list.
+    
+    Args:
+        headers: Gmail ``payload.headers`` list of name/value dicts
+        defaults: Fallback value for each wanted header, keyed by lowercased name
+        
+    Returns:
+        Value for every key of ``defaults``, matched case-insensitively
+    """
+    found = {name: h['value'] for h in headers if (name := h['name'].lower()) in defaults}
+    return {**defaults, **found}
+
+
+def _decode_body_data(data: str) -> str:
+    """Decode a URL-safe base64 message body as returned by the Gmail API.
+    
+    Translates the alphabet with a precomputed table and decodes 4-byte
+    aligned chunks of a ``memoryview`` with the C-level ``binascii``
+    decoder into one preallocated buffer, so the encoded body is never
+    copied just to pad it. Gmail may omit padding; only the final chunk is
+    padded.
+    """
+    raw = memoryview(data.encode('ascii').translate(_URLSAFE_TRANS))
+    decoded = bytearray(len(raw) * 3 // 4 + 2)
+    size = 0
+    for start in range(0, len(raw), DECODE_CHUNK_SIZE):
+        chunk = raw[start:start + DECODE_CHUNK_SIZE]
+        if len(chunk) % 4:
+            chunk = bytes(chunk) + b'=='
+        block = binascii.a2b_base64(chunk)
+        decoded[size:size + len(block)] = block
+        size += len(block)
+    return str(memoryview(decoded)[:size], 'utf-8', 'replace')
+
+
+def _encode_header(value: str, addresses: bool = False) -> str:
+    """RFC 2047-encode a header value if it is not plain ASCII.
+    
+    For address headers only the display names are encoded, so the
+    addresses themselves stay readable to mail servers.
+    """
+    if '\r' in value or '\n' in value:
+        raise ValueError("Header values must not contain line breaks")
+    if value.isascii():
+        return value
+    if addresses:
+        try:
+            return ', '.join(formataddr(pair, 'utf-8') for pair in getaddresses([value]))
+        except UnicodeEncodeError:
+            # Non-ASCII address part; encode the whole value as MIMEText would
+            pass
+    return Header(value, 'utf-8').encode(linesep='\r\n')
+
+
+def _build_raw_message(to: str, subject: str, body: str) -> str:
+    """Build a single-part text/plain message as the Gmail API ``raw`` value.
+    
+    The RFC 822 bytes are assembled directly rather than through
+    ``email.mime`` and its generator, which is far more machinery than a
+    one-part plain text message needs. The body is base64 transfer-encoded
+    in 76-character lines, so long lines cannot break the 998-octet limit.
+    """
+    raw = (
+        f"To: {_encode_header(to, addresses=True)}\r\n"
+        f"Subject: {_encode_header(subject)}\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    ).encode('ascii')
+    encoded = base64.b64encode(body.encode('utf-8'))
+    # 76-character lines, CRLF-terminated like the header block
+    raw += b''.join(encoded[start:start + 76] + b'\r\n' for start in range(0, len(encoded), 76))
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def _write_token(token_json: str) -> bool:
+    """Write token JSON to TOKEN_PATH.
+    
+    The token is written to a temporary file and atomically moved into
+    place, so a crash mid-write cannot leave a corrupt token behind. The
+    temporary file is private from the start and takes over the mode of an
+    existing token, so the secret is never more readable than before.
+    """
+    global _TOKEN_EXISTS
+    logger.info("Saving credentials to token.json")
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(TOKEN_PATH).st_mode)
+        except FileNotFoundError:
+            mode = 0o600
+        tmp_path = TOKEN_PATH.with_suffix('.tmp')
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, 'w') as token:
+            token.write(token_json)
+            token.flush()
+            os.fsync(token.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, TOKEN_PATH)
+        _TOKEN_EXISTS = True
+        return True
+    except Exception as e:
+        logger.error(f"Error saving credentials to token.json: {e}", exc_info=True)
+        return False
+
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that parses and serializes bodies with orjson."""
+
+    def serialize(self, body_value):
+        if self._data_wrapper and isinstance(body_value, dict) and "data" not in body_value:
+            body_value = {"data": body_value}
+        return orjson.dumps(body_value).decode('utf-8')
+
+    def deserialize(self, content):
+        try:
+            body = orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return content.decode('utf-8') if isinstance(content, bytes) else content
+        if self._data_wrapper and "data" in body:
+            body = body["data"]
+        return body
+
+
+@functools.lru_cache(maxsize=None)
+def _discovery_doc() -> str:
+    """Load the Gmail v1 discovery document bundled with googleapiclient.
+    
+    Read from disk once per process; later service builds reuse it.
+    """
+    doc = discovery_cache.get_static_doc('gmail', 'v1')
+    if doc is None:
+        raise RuntimeError("No static discovery document bundled for gmail v1")
+    return doc
+
+
+class _BatchScheduler:
+    """Coalesces API calls from concurrent handlers into shared batch requests.
+    
+    The first caller to arrive flushes immediately. Calls submitted while a
+    flush is in flight queue up and go out together as one batch request as
+    soon as it completes, so a lone caller pays no extra latency while
+    concurrent callers share round trips. A leader flushes once and then
+    hands over to a waiting caller, so no caller keeps serving others.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._flushing = False
+
+    def execute(self, service, method: Callable[..., HttpRequest], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute one API call, possibly batched with concurrent calls.
+        
+        Args:
+            service: Gmail API service object
+            method: Resource method, e.g. ``self._messages_api.list``
+            kwargs: Keyword arguments for the call
+            
+        Returns:
+            The API response
+        """
+        future = concurrent.futures.Future()
+        with self._cond:
+            self._pending.append((service, method, kwargs, future))
+            while self._flushing and not future.done():
+                self._cond.wait()
+            if future.done():
+                return future.result()
+            # Nobody is flushing and this call is still queued: lead one flush
+            self._flushing = True
+            pending = list(self._pending)
+            self._pending.clear()
+
+        try:
+            self._flush(pending)
+        finally:
+            with self._cond:
+                self._flushing = False
+                self._cond.notify_all()
+        return future.result()
+
+    def _flush(self, pending: List[tuple]) -> None:
+        """Send queued calls and resolve every one of their futures.
+        
+        Requests are built here, on the flushing thread, so they all run over
+        that thread's http.
+        """
+        try:
+            if len(pending) == 1:
+                _, method, kwargs, future = pending[0]
+                self._execute_one(method, kwargs, future)
+                return
+
+            def _resolve(request_id, response, exception):
+                future = pending[int(request_id)][3]
+                if exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(response)
+
+            service = pending[0][0]
+            for start in range(0, len(pending), BATCH_SIZE):
+                self._flush_chunk(service, pending[start:start + BATCH_SIZE], start, _resolve)
+        except Exception as e:
+            for *_, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for *_, future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("Batched API call was not resolved"))
+
+    def _flush_chunk(self, service, chunk: List[tuple], start: int, callback: Callable) -> None:
+        """Send up to BATCH_SIZE queued calls as one batch request."""
+        try:
+            batch = service.new_batch_http_request(callback=callback)
+            for index, (_, method, kwargs, future) in enumerate(chunk, start):
+                try:
+                    request = method(**kwargs)
+                except Exception as e:
+                    # Only the caller whose arguments were bad sees the error
+                    future.set_exception(e)
+                    continue
+                batch.add(request, request_id=str(index))
+        except Exception as e:
+            for *_, future in chunk:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        try:
+            batch.execute()
+        except Exception as e:
+            logger.warning(f"Batch request failed, falling back to individual requests: {e}")
+            for _, method, kwargs, future in chunk:
+                if not future.done():
+                    self._execute_one(method, kwargs, future)
+
+    @staticmethod
+    def _execute_one(method, kwargs, future) -> None:
+        try:
+            future.set_result(method(**kwargs).execute())
+        except Exception as e:
+            future.set_exception(e)
+
+
 class GmailMCPServer:
     """Gmail MCP Server implementation."""
     
@@ -48,118 +376,487 @@ class GmailMCPServer:
             name: Name of the MCP server instance
         """
         self.mcp = FastMCP(name)
+        # Authenticated Gmail service, built once and shared by all handlers
+        self._service = None
+        self._creds = None
+        # Resource accessors bound once per build instead of per API call
+        self._messages_api = None
+        self._drafts_api = None
+        # Last token JSON saved to TOKEN_PATH, used to skip redundant writes
+        self._last_token_json = None
+        # Writes token.json off the request path; one worker keeps them ordered
+        self._token_writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='gmail-token'
+        )
+        # Handlers reach _get_gmail_service from worker threads, so the cache
+        # is guarded by a thread lock rather than an anyio.Lock
+        self._service_lock = threading.Lock()
+        # Per-thread transports, see _thread_http
+        self._local = threading.local()
+        # Message bodies by message ID, in least-recently-used order. Gmail
+        # message content is immutable, so entries never go stale. Only
+        # touched from the event loop thread.
+        self._body_cache: "OrderedDict[str, str]" = OrderedDict()
+        # (uri, max_results[, query]) -> (expiry time, formatted response)
+        self._response_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Shares round trips between list calls of concurrent handlers
+        self._batch_scheduler = _BatchScheduler()
+        # Handler workflows run here, one worker (and so one keep-alive
+        # connection) per concurrent API call rather than anyio's default 40
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=MAX_CONCURRENT_REQUESTS,
+            thread_name_prefix='gmail-api'
+        )
+        # Event loop that submitted work to the executor, set by _call
+        self._loop = None
+        # Created lazily, as it must belong to the running event loop
+        self._request_limiter = None
         self._setup_resources()
         self._setup_tools()
     
     def _get_gmail_service(self) -> Optional[object]:
         """Get authenticated Gmail service.
         
+        The service is cached on the instance. Cached credentials that expire
+        are refreshed in place, which the cached service picks up without a
+        rebuild; the service is only rebuilt for newly obtained credentials.
+        
         Returns:
             Gmail API service object or None if authentication fails
         """
-        creds = None
-        
-        if TOKEN_PATH.exists():
-            creds = Credentials.from_authorized_user_file(str(TOKEN_PATH), SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
+        with self._service_lock:
+            if self._service is not None and self._creds and self._creds.valid:
+                return self._service
+
+            creds = self._creds
+            if creds is None and _TOKEN_EXISTS:
                 try:
-                    logger.info("Refreshing expired credentials...")
-                    creds.refresh(Request())
-                    logger.info("Credentials refreshed successfully.")
-                except Exception as e:
-                    logger.error(f"Error refreshing credentials: {e}", exc_info=True)
-                    creds = None 
+                    creds = Credentials.from_authorized_user_file(TOKEN_PATH_STR, SCOPES)
+                except FileNotFoundError:
+                    logger.warning("token.json disappeared, re-running OAuth flow")
             
             if not creds or not creds.valid:
-                logger.info("No valid credentials, starting OAuth flow...")
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    str(CREDENTIALS_PATH), SCOPES)
-                creds = flow.run_local_server(port=0) 
-                logger.info("OAuth flow complete, credentials obtained.")
+                if creds and creds.expired and creds.refresh_token:
+                    try:
+                        logger.info("Refreshing expired credentials...")
+                        creds.refresh(Request())
+                        logger.info("Credentials refreshed successfully.")
+                    except Exception as e:
+                        logger.error(f"Error refreshing credentials: {e}", exc_info=True)
+                        creds = None 
+                
+                if not creds or not creds.valid:
+                    logger.info("No valid credentials, starting OAuth flow...")
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        CREDENTIALS_PATH_STR, SCOPES)
+                    creds = flow.run_local_server(port=0) 
+                    logger.info("OAuth flow complete, credentials obtained.")
+                
+                self._save_token(creds)
+            else:
+                logger.info("Using existing valid credentials.")
+
+            if creds is self._creds and self._service is not None:
+                # Refreshed in place; the service already holds these credentials
+                return self._service
+
+            try:
+                service = build_from_document(
+                    _discovery_doc(),
+                    # Reuse this thread's transport rather than letting the
+                    # builder allocate a throwaway one
+                    http=self._thread_http(creds),
+                    requestBuilder=self._build_request,
+                    model=_OrjsonModel() if orjson is not None else None
+                )
+                logger.info("Gmail service object built successfully.")
+            except Exception as e:
+                logger.error(f"Error building Gmail service: {e}", exc_info=True)
+                self._service = None
+                self._creds = None
+                return None
+
+            self._creds = creds
+            self._service = service
+            self._messages_api = service.users().messages()
+            self._drafts_api = service.users().drafts()
+            return service
+
+    def _save_token(self, creds: Credentials) -> None:
+        """Persist credentials to TOKEN_PATH without blocking the caller.
+        
+        The token is serialized here and written by a single background
+        writer thread, which keeps writes in order. Nothing is written if the
+        token is unchanged since the last save, unless that write failed.
+        
+        Args:
+            creds: Credentials to persist
+        """
+        token_json = creds.to_json()
+        if token_json == self._last_token_json:
+            return
+        self._last_token_json = token_json
+        future = self._token_writer.submit(_write_token, token_json)
+        future.add_done_callback(functools.partial(self._token_written, token_json))
+
+    def _token_written(self, token_json: str, future: concurrent.futures.Future) -> None:
+        """Forget a token whose write failed, so the next save retries it."""
+        if not future.result() and self._last_token_json == token_json:
+            self._last_token_json = None
+
+    def _thread_http(self, creds: Credentials) -> google_auth_httplib2.AuthorizedHttp:
+        """Get the calling thread's authorized http for the given credentials.
+        
+        httplib2.Http is not thread-safe, so every worker thread gets its own.
+        Each thread keeps its transport, and with it the open keep-alive TLS
+        connection to the API, for its whole lifetime; only the authorizing
+        wrapper is replaced when the credentials change.
+        
+        Args:
+            creds: Credentials to authorize requests with
+            
+        Returns:
+            Thread-local AuthorizedHttp
+        """
+        local = self._local
+        if getattr(local, 'transport', None) is None:
+            local.transport = build_http()
+            local.transport.timeout = HTTP_TIMEOUT
+        if getattr(local, 'creds', None) is not creds:
+            local.http = google_auth_httplib2.AuthorizedHttp(creds, http=local.transport)
+            local.creds = creds
+        return local.http
+
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        """Build an API request bound to the calling thread's own authorized http.
+        
+        Used as the ``requestBuilder`` of the cached service so that handlers
+        running on different worker threads never share an ``httplib2.Http``.
+        
+        Args:
+            http: Authorized http object the service was built with
             
-            logger.info("Saving credentials to token.json")
-            with open(TOKEN_PATH, 'w') as token:
-                token.write(creds.to_json())
-        else:
-            logger.info("Using existing valid credentials.")
+        Returns:
+            HttpRequest that executes over a thread-local connection
+        """
+        return HttpRequest(self._thread_http(http.credentials), *args, **kwargs)
+    
+    def _execute_batch(self, service, requests: List[HttpRequest],
+                       return_exceptions: bool = False) -> Optional[List[Union[Dict[str, Any], Exception]]]:
+        """Execute API requests through Gmail batch requests.
+        
+        Requests are sent in chunks of BATCH_SIZE, so N calls cost one HTTP
+        round trip per chunk instead of one each.
+        
+        Args:
+            service: Gmail API service object
+            requests: API requests to execute
+            return_exceptions: Return a failed call's exception in its place
+                instead of raising the first one
+            
+        Returns:
+            Responses in the same order as the requests, or None if the batch
+            endpoint itself could not be used
+        """
+        responses: Dict[str, Union[Dict[str, Any], Exception]] = {}
+        errors: List[Exception] = []
+
+        def _collect(request_id, response, exception):
+            if exception is not None:
+                errors.append(exception)
+                responses[request_id] = exception
+            else:
+                responses[request_id] = response
+
+        for start in range(0, len(requests), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=_collect)
+            for index, request in enumerate(requests[start:start + BATCH_SIZE], start):
+                batch.add(request, request_id=str(index))
+            try:
+                batch.execute()
+            except Exception as e:
+                logger.warning(f"Batch request failed, falling back to individual requests: {e}")
+                return None
+
+        if errors and not return_exceptions:
+            raise errors[0]
+        return [responses[str(index)] for index in range(len(requests))]
+
+    async def _call(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a blocking function on the Gmail API worker pool.
+        
+        Args:
+            fn: Function to run
+            *args: Positional arguments for ``fn``
+            
+        Returns:
+            Whatever ``fn`` returns
+        """
+        self._loop = asyncio.get_running_loop()
+        return await self._loop.run_in_executor(self._executor, fn, *args)
+
+    def _fetch_all(self, service, method: Callable[..., HttpRequest], calls: List[Dict[str, Any]],
+                   return_exceptions: bool = False) -> List[Union[Dict[str, Any], Exception]]:
+        """Run the same API method for several sets of arguments.
+        
+        All calls go out as one batch request. If the batch endpoint is
+        unavailable, the calls are handed back to the event loop and issued
+        individually and concurrently instead of one after another. Must be
+        called from a worker started by ``_call``.
+        
+        Args:
+            service: Gmail API service object
+            method: Resource method, e.g. ``self._messages_api.get``
+            calls: Keyword arguments for each call
+            return_exceptions: Return a failed call's exception in its place
+                instead of raising the first one
+            
+        Returns:
+            Responses in the same order as the calls
+        """
+        responses = self._execute_batch(service, [method(**kwargs) for kwargs in calls], return_exceptions)
+        if responses is not None:
+            return responses
+        return asyncio.run_coroutine_threadsafe(
+            self._fetch_each(method, calls, return_exceptions), self._loop).result()
+
+    async def _fetch_each(self, method: Callable[..., HttpRequest], calls: List[Dict[str, Any]],
+                          return_exceptions: bool = False) -> List[Union[Dict[str, Any], Exception]]:
+        """Issue API calls individually and concurrently.
+        
+        The calls run on anyio's thread pool rather than ``self._executor``,
+        whose worker is blocked waiting for them in ``_fetch_all``; sharing the
+        pool could deadlock once every worker is waiting.
+        
+        Args:
+            method: Resource method, e.g. ``self._messages_api.get``
+            calls: Keyword arguments for each call
+            return_exceptions: Return a failed call's exception in its place
+                instead of raising the first one
+            
+        Returns:
+            Responses in the same order as the calls
+        """
+        if self._request_limiter is None:
+            self._request_limiter = anyio.CapacityLimiter(MAX_CONCURRENT_REQUESTS)
+
+        def _single(kwargs):
+            # Built on the worker thread so it executes over that thread's http
+            return method(**kwargs).execute()
+
+        return await asyncio.gather(*(
+            anyio.to_thread.run_sync(_single, kwargs, limiter=self._request_limiter)
+            for kwargs in calls
+        ), return_exceptions=return_exceptions)
+
+    def _cached_response(self, key: tuple) -> Optional[str]:
+        """Return a formatted response cached under ``key`` if it is still fresh."""
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._response_cache[key]
+            return None
+        return entry[1]
+
+    def _cache_response(self, key: tuple, content: str) -> None:
+        """Cache a formatted response for RESPONSE_CACHE_TTL seconds."""
+        self._response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, content)
+        self._response_cache.move_to_end(key)
+        if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    def _list_paged(self, service, method: Callable[..., HttpRequest], key: str,
+                    max_results: int, **kwargs) -> List[Dict[str, Any]]:
+        """List up to ``max_results`` items, following ``nextPageToken``.
+        
+        Gmail caps each page at MAX_PAGE_SIZE, so larger requests take several
+        pages. Each page asks only for item IDs and the next page token.
+        
+        Args:
+            service: Gmail API service object
+            method: List method, e.g. ``self._messages_api.list``
+            key: Response field holding the items, e.g. ``'messages'``
+            max_results: Maximum number of items to return
+            **kwargs: Extra arguments for every page request
+            
+        Returns:
+            Up to ``max_results`` items
+        """
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while len(items) < max_results:
+            page_kwargs = dict(
+                kwargs,
+                userId='me',
+                maxResults=min(max_results - len(items), MAX_PAGE_SIZE),
+                fields=f'{key}/id,nextPageToken'
+            )
+            if page_token:
+                page_kwargs['pageToken'] = page_token
+            results = self._batch_scheduler.execute(service, method, page_kwargs)
+            logger.debug("List %s API call returned: %r", key, results)
+            items.extend(results.get(key, []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+        return items[:max_results]
+
+    def _list_messages(self, service, max_results: int, **kwargs) -> List[Dict[str, Any]]:
+        """List up to ``max_results`` message IDs; see ``_list_paged``."""
+        return self._list_paged(service, self._messages_api.list, 'messages', max_results, **kwargs)
+
+    def _list_drafts(self, service, max_results: int, **kwargs) -> List[Dict[str, Any]]:
+        """List up to ``max_results`` draft IDs; see ``_list_paged``."""
+        return self._list_paged(service, self._drafts_api.list, 'drafts', max_results, **kwargs)
+
+    async def _list_and_format(self, handler: str,
+                               list_items: Callable[..., List[Dict[str, Any]]],
+                               format_items: Callable[[Any, List[Dict[str, Any]]], str],
+                               max_results: int, empty_message: str, error_message: str,
+                               **list_kwargs) -> str:
+        """List messages or drafts and format their metadata for display.
+        
+        Shared by the list resources and ``search_emails``. Formatted
+        responses are cached for RESPONSE_CACHE_TTL seconds.
+        
+        Args:
+            handler: Name of the calling handler, used in logs and the cache key
+            list_items: Lister such as ``self._list_messages``, called on the
+                worker thread with the service, ``max_results`` and ``list_kwargs``
+            format_items: Formatter such as ``self._format_messages``
+            max_results: Maximum number of items to list
+            empty_message: Response when nothing is found
+            error_message: Prefix of the response when the API call fails
+            **list_kwargs: Extra list arguments, e.g. ``q`` or ``labelIds``
+            
+        Returns:
+            Formatted list, or an error message
+        """
+        cache_key = (handler, format_items, max_results, list_kwargs.get('q'))
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            return cached
+
+        def _run():
+            # The whole workflow runs in one worker thread hop
+            service = self._get_gmail_service()
+            if not service:
+                logger.warning(f"Failed to get Gmail service in {handler}")
+                return "Failed to authenticate Gmail service", False
+
+            items = list_items(service, max_results, **list_kwargs)
+            if not items:
+                logger.info(empty_message)
+                return empty_message, True
+            return format_items(service, items), True
 
         try:
-            service = build('gmail', 'v1', credentials=creds)
-            logger.info("Gmail service object built successfully.")
-            return service
+            content, cacheable = await self._call(_run)
         except Exception as e:
-            logger.error(f"Error building Gmail service: {e}", exc_info=True)
-            return None
-    
-    def _format_messages(self, service, messages: List[Dict[str, Any]]) -> str:
+            logger.error(f"Error inside {handler}: {e}", exc_info=True)
+            return f"{error_message}: {str(e)}"
+
+        if cacheable:
+            self._cache_response(cache_key, content)
+        return content
+
+    @staticmethod
+    def _format_message_ids(service, messages: List[Dict[str, Any]]) -> str:
+        """Format listed messages as one ID per line, without any API calls."""
+        return "\n".join(msg['id'] for msg in messages)
+
+    def _format_messages(self, service, messages: List[Dict[str, Any]],
+                         return_exceptions: bool = False) -> str:
         """Format messages for display.
         
         Args:
             service: Gmail API service object
             messages: List of message dictionaries
+            return_exceptions: Show a message that could not be fetched as an
+                inline error instead of raising
             
         Returns:
             Formatted message string
         """
+        # googleapiclient only expands repeated parameters given as a list;
+        # one list is shared by every call
+        metadata_headers = list(_META_HDRS)
+        message_data = self._fetch_all(service, self._messages_api.get, [
+            {
+                'userId': 'me',
+                'id': msg['id'],
+                'format': 'metadata',
+                'metadataHeaders': metadata_headers,
+                'fields': 'payload/headers'
+            }
+            for msg in messages
+        ], return_exceptions)
+
         formatted_msgs = []
-        for msg in messages:
-            message = service.users().messages().get(
-                userId='me',
-                id=msg['id'],
-                format='metadata',
-                metadataHeaders=['Subject', 'From', 'To', 'Date']
-            ).execute()
-            
+        for msg, message in zip(messages, message_data):
+            if isinstance(message, BaseException):
+                formatted_msgs.append(_format_error(id=msg['id'], error=message))
+                continue
             headers = message['payload']['headers']
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-            to = next((h['value'] for h in headers if h['name'] == 'To'), 'No Recipient')
-            date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
-            
-            formatted_msgs.append(
-                f"Message ID: {msg['id']}\n"
-                f"From: {sender}\n"
-                f"To: {to}\n"
-                f"Date: {date}\n"
-                f"Subject: {subject}\n"
-                f"{'-'*50}\n"
-            )
+            formatted_msgs.append(_format_message(id=msg['id'], **_extract_headers(headers, _MESSAGE_DEFAULTS)))
         
         return "\n".join(formatted_msgs)
+
+    def _format_drafts(self, service, drafts: List[Dict[str, Any]]) -> str:
+        """Format drafts for display.
+        
+        Args:
+            service: Gmail API service object
+            drafts: List of draft dictionaries
+            
+        Returns:
+            Formatted draft string
+        """
+        draft_data = self._fetch_all(service, self._drafts_api.get, [
+            {
+                'userId': 'me',
+                'id': draft['id'],
+                'format': 'metadata',
+                'fields': 'message/payload/headers'
+            }
+            for draft in drafts
+        ])
+
+        formatted_drafts = []
+        for draft, data in zip(drafts, draft_data):
+            headers = data['message']['payload']['headers']
+            formatted_drafts.append(_format_draft(id=draft['id'], **_extract_headers(headers, _DRAFT_DEFAULTS)))
+
+        return "\n".join(formatted_drafts)
     
     def _extract_message_body(self, payload: Dict[str, Any]) -> str:
-        """Extract the message body from the payload, preferring text/plain."""
-        body = ""
-        if payload.get('mimeType') == 'text/plain' and 'data' in payload.get('body', {}):
-            encoded_body = payload['body']['data']
-            decoded_body = base64.urlsafe_b64decode(encoded_body).decode('utf-8')
-            return decoded_body
-        elif payload.get('mimeType') == 'text/html' and 'data' in payload.get('body', {}):
-            encoded_body = payload['body']['data']
-            decoded_body = base64.urlsafe_b64decode(encoded_body).decode('utf-8')
-            # Keep HTML as a fallback if plain text wasn't found yet
-            body = decoded_body # We might return this if no plain text is found later
-        elif payload.get('mimeType', '').startswith('multipart/'):
-            parts = payload.get('parts', [])
-            plain_text_body = ""
-            html_body = ""
-            for part in parts:
-                # Recursively check parts, prioritize the result from text/plain
-                part_body = self._extract_message_body(part)
-                if part.get('mimeType') == 'text/plain' and part_body:
-                    plain_text_body = part_body
-                    break # Found plain text, stop searching this level
-                elif part.get('mimeType') == 'text/html' and part_body and not html_body:
-                     # Keep first HTML body found as fallback
-                    html_body = part_body
-
-            # Return plain text if found, otherwise HTML, otherwise whatever was in 'body' initially
-            return plain_text_body if plain_text_body else html_body if html_body else body
-
-        # If no body found in parts or specific types, return the initial fallback (might be empty)
-        return body
+        """Extract the message body from the payload, preferring text/plain.
+        
+        MIME parts are walked depth-first in document order. The first
+        text/plain body is decoded and returned immediately; the first
+        text/html body is only remembered, and decoded if no plain text exists.
+        """
+        html_data = None
+        stack = deque([payload])
+        while stack:
+            part = stack.pop()
+            mime_type = part.get('mimeType', '')
+            if mime_type.startswith(NON_TEXT_MIME_PREFIXES):
+                continue
+            data = part.get('body', {}).get('data')
+            if mime_type == 'text/plain' and data:
+                return _decode_body_data(data)
+            if mime_type == 'text/html' and data and html_data is None:
+                # Keep HTML as a fallback if plain text isn't found later
+                html_data = data
+            elif mime_type.startswith('multipart/'):
+                stack.extend(reversed(part.get('parts', [])))
+
+        if html_data is None:
+            return ""
+        return _decode_body_data(html_data)
 
     def _setup_resources(self):
         """Set up MCP resources (data sources accessible via URI)."""
@@ -174,127 +871,26 @@ class GmailMCPServer:
             """Get a list of recent emails (metadata only) from the inbox."""
             max_results = 10
             logger.info(f"Executing get_emails with fixed max_results={max_results}")
-            try:
-                logger.info("Attempting to get Gmail service...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
-                if not service:
-                    logger.warning("Failed to get Gmail service in get_emails")
-                    return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully.")
-
-                logger.info("Attempting to list messages...")
-                def _list_messages():
-                    return service.users().messages().list(
-                        userId='me',
-                        maxResults=max_results
-                    ).execute()
-                results = await anyio.to_thread.run_sync(_list_messages)
-                logger.info(f"List messages API call returned: {results}")
-
-                messages = results.get('messages', [])
-                if not messages:
-                    logger.info("No messages found.")
-                    return "No messages found."
-                logger.info(f"Found {len(messages)} messages.")
-
-                logger.info("Attempting to format messages...")
-                formatted_response = await anyio.to_thread.run_sync(self._format_messages, service, messages)
-                logger.info("Messages formatted successfully.")
-                return formatted_response
-            except Exception as e:
-                logger.error(f"Error inside get_emails: {e}", exc_info=True)
-                return f"Error retrieving messages: {str(e)}"
+            return await self._list_and_format(
+                'get_emails', self._list_messages, self._format_messages, max_results,
+                "No messages found.", "Error retrieving messages")
 
         @self.mcp.resource("gmail://drafts/{max_results}")
         async def get_drafts(max_results: int = 10) -> str:
             """Get a list of recent email drafts (metadata only)."""
             logger.info(f"Executing get_drafts with max_results={max_results}")
-            try:
-                logger.info("Attempting to get Gmail service (get_drafts)...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
-                if not service:
-                    logger.warning("Failed to get Gmail service in get_drafts")
-                    return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully (get_drafts).")
-
-                logger.info("Attempting to list drafts...")
-                def _list_drafts():
-                    return service.users().drafts().list(
-                        userId='me',
-                        maxResults=max_results
-                    ).execute()
-                results = await anyio.to_thread.run_sync(_list_drafts)
-                logger.info(f"List drafts API call returned: {results}")
-
-                drafts = results.get('drafts', [])
-                if not drafts:
-                    logger.info("No drafts found.")
-                    return "No drafts found."
-                logger.info(f"Found {len(drafts)} drafts.")
-
-                formatted_drafts = []
-                logger.info("Formatting drafts...")
-                for draft in drafts:
-                    def _get_single_draft(draft_id):
-                        return service.users().drafts().get(
-                            userId='me',
-                            id=draft_id,
-                            format='metadata'
-                        ).execute()
-                    draft_data = await anyio.to_thread.run_sync(_get_single_draft, draft['id'])
-
-                    message = draft_data['message']
-                    headers = message['payload']['headers']
-                    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                    to = next((h['value'] for h in headers if h['name'] == 'To'), 'No Recipient')
-
-                    formatted_drafts.append(
-                        f"Draft ID: {draft['id']}\n"
-                        f"To: {to}\n"
-                        f"Subject: {subject}\n"
-                        f"{'-'*50}\n"
-                    )
-                logger.info("Drafts formatted.")
-                return "\n".join(formatted_drafts)
-            except Exception as e:
-                logger.error(f"Error inside get_drafts: {e}", exc_info=True)
-                return f"Error retrieving drafts: {str(e)}"
+            return await self._list_and_format(
+                'get_drafts', self._list_drafts, self._format_drafts, max_results,
+                "No drafts found.", "Error retrieving drafts")
 
         @self.mcp.resource("gmail://sent/{max_results}")
         async def get_sent_emails(max_results: int = 10) -> str:
             """Get a list of recent sent emails (metadata only)."""
             logger.info(f"Executing get_sent_emails with max_results={max_results}")
-            try:
-                logger.info("Attempting to get Gmail service (get_sent_emails)...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
-                if not service:
-                    logger.warning("Failed to get Gmail service in get_sent_emails")
-                    return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully (get_sent_emails).")
-
-                logger.info("Attempting to list sent messages...")
-                def _list_sent():
-                    return service.users().messages().list(
-                        userId='me',
-                        labelIds=['SENT'],
-                        maxResults=max_results
-                    ).execute()
-                results = await anyio.to_thread.run_sync(_list_sent)
-                logger.info(f"List sent messages API call returned: {results}")
-
-                messages = results.get('messages', [])
-                if not messages:
-                    logger.info("No sent messages found.")
-                    return "No sent messages found."
-                logger.info(f"Found {len(messages)} sent messages.")
-
-                logger.info("Attempting to format sent messages...")
-                formatted_response = await anyio.to_thread.run_sync(self._format_messages, service, messages)
-                logger.info("Sent messages formatted successfully.")
-                return formatted_response
-            except Exception as e:
-                logger.error(f"Error inside get_sent_emails: {e}", exc_info=True)
-                return f"Error retrieving sent messages: {str(e)}"
+            return await self._list_and_format(
+                'get_sent_emails', self._list_messages, self._format_messages, max_results,
+                "No sent messages found.", "Error retrieving sent messages",
+                labelIds=['SENT'])
 
     def _setup_tools(self):
         """Set up MCP tools (executable actions callable by name)."""
@@ -308,46 +904,126 @@ class GmailMCPServer:
                 message_id: The unique identifier of the Gmail message.
             """
             logger.info(f"Executing get_email_content for message_id={message_id}")
-            try:
-                logger.info("Attempting to get Gmail service (get_email_content)...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
+            cached = self._body_cache.get(message_id)
+            if cached is not None:
+                self._body_cache.move_to_end(message_id)
+                return cached
+
+            def _run():
+                service = self._get_gmail_service()
                 if not service:
                     logger.warning("Failed to get Gmail service in get_email_content")
-                    return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully (get_email_content).")
-
-                logger.info(f"Attempting to get full message content for ID: {message_id}...")
-                def _get_full_message():
-                    return service.users().messages().get(
-                        userId='me',
-                        id=message_id,
-                        format='full' # Request full format to get the body
-                    ).execute()
+                    return "Failed to authenticate Gmail service", False
 
-                message_data = await anyio.to_thread.run_sync(_get_full_message)
-                logger.info(f"Full message data received for ID: {message_id}")
+                message_data = self._messages_api.get(
+                    userId='me',
+                    id=message_id,
+                    format='full', # Request full format to get the body
+                    fields='payload,snippet'
+                ).execute()
 
                 if not message_data or 'payload' not in message_data:
-                     logger.warning(f"No payload found for message ID: {message_id}")
-                     return f"Could not retrieve content for message ID: {message_id}"
-
-                # Extract the body using the helper function
-                body_content = await anyio.to_thread.run_sync(self._extract_message_body, message_data['payload'])
+                    logger.warning(f"No payload found for message ID: {message_id}")
+                    return f"Could not retrieve content for message ID: {message_id}", False
 
+                body_content = self._extract_message_body(message_data['payload'])
                 if not body_content:
                     logger.info(f"No suitable body content found for message ID: {message_id}. Returning snippet.")
                     # Fallback to snippet if body extraction fails
-                    return message_data.get('snippet', 'No content available.')
-                else:
-                    logger.info(f"Body content extracted successfully for message ID: {message_id}")
-                    return body_content
+                    return message_data.get('snippet', 'No content available.'), True
+                return body_content, True
 
+            try:
+                content, cacheable = await self._call(_run)
             except Exception as e:
                 logger.error(f"Error inside get_email_content: {e}", exc_info=True)
                 return f"Error retrieving message content for ID {message_id}: {str(e)}"
 
+            if cacheable:
+                self._body_cache[message_id] = content
+                if len(self._body_cache) > BODY_CACHE_SIZE:
+                    self._body_cache.popitem(last=False)
+            return content
+
+        @self.mcp.tool("get_messages_batch")
+        async def get_messages_batch(message_ids: List[str], fmt: str = "metadata") -> str:
+            """Fetches several emails by ID in one call.
+            Use this instead of calling get_email_content repeatedly when you need more than one message.
+
+            Args:
+                message_ids: The unique identifiers of the Gmail messages, at most 250 per call.
+                fmt: "metadata" for From, To, Subject and Date, or "full" for the body content.
+            """
+            logger.info(f"Executing get_messages_batch for {len(message_ids)} messages (fmt={fmt})")
+            if fmt not in ('metadata', 'full'):
+                return f"Unsupported fmt '{fmt}'; use 'metadata' or 'full'."
+            message_ids = list(dict.fromkeys(message_ids))
+            if not message_ids:
+                return "No message IDs given."
+            if len(message_ids) > MAX_BATCH_MESSAGE_IDS:
+                return (f"Too many message IDs ({len(message_ids)}); "
+                        f"request at most {MAX_BATCH_MESSAGE_IDS} per call.")
+
+            bodies = {}
+            if fmt == 'full':
+                for message_id in message_ids:
+                    cached = self._body_cache.get(message_id)
+                    if cached is not None:
+                        self._body_cache.move_to_end(message_id)
+                        bodies[message_id] = cached
+            missing = [message_id for message_id in message_ids if message_id not in bodies]
+
+            def _run():
+                service = self._get_gmail_service()
+                if not service:
+                    logger.warning("Failed to get Gmail service in get_messages_batch")
+                    return "Failed to authenticate Gmail service", {}
+
+                if fmt == 'metadata':
+                    messages = [{'id': message_id} for message_id in message_ids]
+                    return self._format_messages(service, messages, return_exceptions=True), {}
+
+                # One bad or rate-limited ID must not lose the other bodies
+                message_data = self._fetch_all(service, self._messages_api.get, [
+                    {'userId': 'me', 'id': message_id, 'format': 'full', 'fields': 'payload,snippet'}
+                    for message_id in missing
+                ], return_exceptions=True)
+                fetched = {}
+                for message_id, message in zip(missing, message_data):
+                    if isinstance(message, BaseException):
+                        logger.warning(f"Could not fetch message ID {message_id}: {message}")
+                        fetched[message_id] = message
+                        continue
+                    body_content = self._extract_message_body(message.get('payload') or {})
+                    fetched[message_id] = body_content or message.get('snippet', 'No content available.')
+                return None, fetched
+
+            content, fetched = None, {}
+            if fmt == 'metadata' or missing:
+                try:
+                    content, fetched = await self._call(_run)
+                except Exception as e:
+                    logger.error(f"Error inside get_messages_batch: {e}", exc_info=True)
+                    return f"Error retrieving messages: {str(e)}"
+            if content is not None:
+                return content
+
+            for message_id, body_content in fetched.items():
+                if isinstance(body_content, BaseException):
+                    continue
+                self._body_cache[message_id] = body_content
+                if len(self._body_cache) > BODY_CACHE_SIZE:
+                    self._body_cache.popitem(last=False)
+            bodies.update(fetched)
+            return "\n".join(
+                _format_error(id=message_id, error=bodies[message_id])
+                if isinstance(bodies[message_id], BaseException)
+                else f"Message ID: {message_id}\n{bodies[message_id]}\n{_SEP}\n"
+                for message_id in message_ids
+            )
+
         @self.mcp.tool("search_emails")
-        async def search_emails(query: str, max_results: int = 10) -> str:
+        async def search_emails(query: str, max_results: int = 10, ids_only: bool = False) -> str:
             """Search emails using a standard Gmail query string (e.g., 'subject:urgent', 'from:boss@example.com').
             Returns a list of matching emails with their metadata (From, To, Subject, Date, ID).
             Does not return the full email body content.
@@ -355,39 +1031,15 @@ class GmailMCPServer:
             Args:
                 query: The Gmail search query string.
                 max_results: Maximum number of results to return.
+                ids_only: Return only the message IDs, one per line, without
+                    fetching any metadata.
             """
-            logger.info(f"Executing search_emails with query='{query}', max_results={max_results}")
-            try:
-                logger.info("Attempting to get Gmail service (search_emails)...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
-                if not service:
-                    logger.warning("Failed to get Gmail service in search_emails")
-                    return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully (search_emails).")
-
-                logger.info("Attempting to search messages...")
-                def _search():
-                    return service.users().messages().list(
-                        userId='me',
-                        q=query,
-                        maxResults=max_results
-                    ).execute()
-                results = await anyio.to_thread.run_sync(_search)
-                logger.info(f"Search messages API call returned: {results}")
-
-                messages = results.get('messages', [])
-                if not messages:
-                    logger.info("No messages found matching the query.")
-                    return "No messages found matching the query."
-                logger.info(f"Found {len(messages)} matching messages.")
-
-                logger.info("Attempting to format search results...")
-                formatted_response = await anyio.to_thread.run_sync(self._format_messages, service, messages)
-                logger.info("Search results formatted successfully.")
-                return formatted_response
-            except Exception as e:
-                logger.error(f"Error inside search_emails: {e}", exc_info=True)
-                return f"Error searching messages: {str(e)}"
+            logger.info(f"Executing search_emails with query='{query}', max_results={max_results}, ids_only={ids_only}")
+            format_items = self._format_message_ids if ids_only else self._format_messages
+            return await self._list_and_format(
+                'search_emails', self._list_messages, format_items, max_results,
+                "No messages found matching the query.", "Error searching messages",
+                q=query)
 
         @self.mcp.tool("compose_email")
         async def compose_email(to: str, subject: str, body: str, save_as_draft: bool = False) -> str:
@@ -400,55 +1052,66 @@ class GmailMCPServer:
                 save_as_draft: If True, saves the email as a draft instead of sending. Defaults to False (send immediately).
             """
             logger.info(f"Executing compose_email (To: {to}, Subject: {subject}, SaveAsDraft: {save_as_draft})")
-            try:
-                logger.info("Attempting to get Gmail service (compose_email)...")
-                service = await anyio.to_thread.run_sync(self._get_gmail_service)
+
+            def _run():
+                service = self._get_gmail_service()
                 if not service:
                     logger.warning("Failed to get Gmail service in compose_email")
                     return "Failed to authenticate Gmail service"
-                logger.info("Gmail service obtained successfully (compose_email).")
 
-                message = MIMEText(body)
-                message['to'] = to
-                message['subject'] = subject
-                encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-                email = {'raw': encoded_message}
-                logger.info("Email message created and encoded.")
+                email = {'raw': _build_raw_message(to, subject, body)}
 
                 if save_as_draft:
-                    logger.info("Attempting to save draft...")
-                    def _save_draft():
-                        return service.users().drafts().create(
-                            userId='me',
-                            body={'message': email}
-                        ).execute()
-                    draft = await anyio.to_thread.run_sync(_save_draft)
+                    draft = self._drafts_api.create(
+                        userId='me',
+                        body={'message': email}
+                    ).execute()
                     logger.info(f"Draft saved successfully. Draft ID: {draft['id']}")
                     return f"Draft saved successfully. Draft ID: {draft['id']}"
-                else:
-                    logger.info("Attempting to send email...")
-                    def _send_email():
-                        return service.users().messages().send(
-                            userId='me',
-                            body=email
-                        ).execute()
-                    sent_message = await anyio.to_thread.run_sync(_send_email)
-                    logger.info(f"Email sent successfully. Message ID: {sent_message['id']}")
-                    return f"Email sent successfully. Message ID: {sent_message['id']}"
+
+                sent_message = self._messages_api.send(
+                    userId='me',
+                    body=email
+                ).execute()
+                logger.info(f"Email sent successfully. Message ID: {sent_message['id']}")
+                return f"Email sent successfully. Message ID: {sent_message['id']}"
+
+            try:
+                result = await self._call(_run)
             except Exception as e:
                 logger.error(f"Error inside compose_email: {e}", exc_info=True)
                 return f"Error composing email: {str(e)}"
+
+            # The new draft or sent message would be missing from cached lists
+            self._response_cache.clear()
+            return result
     
+    async def arun(self):
+        """Run the MCP server over stdio inside the current event loop."""
+        logger.info("Starting server on stdio transport...")
+        try:
+            await self.mcp.run_stdio_async()
+            logger.info("Server finished running.")
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the worker threads, waiting only for a pending token write."""
+        self._executor.shutdown(wait=False)
+        # Make sure a pending token write reaches the disk
+        self._token_writer.shutdown(wait=True)
+
     def run(self, port: int = 8000):
         """Run the MCP server.
         
+        Synchronous entry point that starts an event loop for ``arun``.
+        
         Args:
             port: Port to run the server on
         """
         try:
             logger.info(f"Starting server on port {port}...")
-            self.mcp.run(transport='stdio')  # Use stdio transport by default
-            logger.info("Server finished running.")
+            anyio.run(self.arun)  # Use stdio transport by default
         except Exception as e:
             logger.error(f"Error running server: {e}", exc_info=True)
             raise
@@ -462,17 +1125,8 @@ if __name__ == "__main__":
     server = GmailMCPServer()
     logger.info("Initialization complete.")
 
-    # Use stdio transport as documented for mcp library
+    # Same path as run_server.py: stdio inside anyio, with close() on exit
     try:
-        logger.info("Attempting server.mcp.run(transport='stdio')...")
-        server.mcp.run(transport='stdio') # Specify stdio transport
-        logger.info("server.mcp.run() finished.") 
+        server.run()
     except Exception as e:
-        logger.error(f"Error during server.mcp.run(): {e}", exc_info=True)
-
-    # NOTE: We are removing the .run() call here because 
-    # 'fastmcp dev' or 'fastmcp install' will handle running the server.
-    # If you wanted to run directly via 'python -m src.server', you would need:
-    # server.mcp.run() # Might default to SSE/HTTP
-    # or
-    # server.mcp.run(transport='stdio') # For stdio 
\ No newline at end of file
+        logger.error(f"Error during server.run(): {e}", exc_info=True)
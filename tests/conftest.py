@@ -0,0 +1,72 @@
+"""
+Shared fixtures for the Gmail MCP Server unit tests.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import anyio
+import pytest
+
+from src.server import GmailMCPServer
+
+
+@pytest.fixture(scope="session")
+def server():
+    """A single GmailMCPServer shared by tests that only inspect its setup."""
+    server = GmailMCPServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def fresh_server():
+    """A GmailMCPServer of the test's own, for tests that change server state.
+    
+    Deep-copying the shared server is not an option: its handlers are
+    closures over the original instance, and its locks and executors
+    cannot be copied. Construction only registers handlers, so it is cheap.
+    """
+    server = GmailMCPServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture(scope="session")
+def registered_names(request, server):
+    """Name sets of the resources, resource templates and tools on the shared server.
+    
+    The registry is listed once per session, so registration tests are plain
+    set-membership checks. When pytest's cache is enabled the names are also
+    stored in it, so ``pytest --cache-show 'gmail_mcp/*'`` shows the registry
+    of the last run.
+    """
+    async def _list_names():
+        mcp = server.mcp
+        resources = [str(r.uri) for r in await mcp.list_resources()]
+        resources += [t.uriTemplate for t in await mcp.list_resource_templates()]
+        return {
+            "resources": sorted(resources),
+            "tools": sorted(t.name for t in await mcp.list_tools()),
+        }
+
+    names = anyio.run(_list_names)
+    # The cache plugin may be disabled, e.g. with -p no:cacheprovider
+    cache = getattr(request.config, "cache", None)
+    if cache is not None:
+        cache.set("gmail_mcp/registered", names)
+    return {kind: frozenset(kind_names) for kind, kind_names in names.items()}
+
+
+@pytest.fixture(scope="session")
+def gmail_service(server):
+    """The shared server's Gmail service, built with OAuth and the API mocked out."""
+    flow = MagicMock()
+    flow.run_local_server.return_value = MagicMock(valid=True)
+    with patch("src.server._TOKEN_EXISTS", False), \
+            patch("src.server.InstalledAppFlow.from_client_secrets_file", return_value=flow), \
+            patch("src.server.build_from_document", return_value=MagicMock()), \
+            patch.object(server, "_save_token"):
+        service = server._get_gmail_service()
+    # The patches only cover construction, so they cannot leak into other tests
+    yield service
+    server._service = server._creds = None
@@ -0,0 +1,440 @@
+"""
+Gmail MCP Server Handler Tests
+============================
+
+Unit tests for the behaviour behind the server's resources and tools, with the
+Gmail API mocked out. They cover:
+- Batched and coalesced API requests
+- Message body decoding and extraction
+- Token saving
+- Body and response caching, listing and search
+- Optional orjson and isal acceleration
+- Raw message composition
+
+Usage:
+------
+   python -m pytest tests/test_handlers.py -v
+"""
+
+import base64
+import concurrent.futures
+import os
+import threading
+import time
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from unittest.mock import MagicMock
+
+import anyio
+import pytest
+import src.server
+from src.server import _BatchScheduler, _build_raw_message, _decode_body_data
+
+class _FakeBatch:
+    """Minimal stand-in for googleapiclient's BatchHttpRequest."""
+
+    def __init__(self, callback, sizes):
+        self._callback = callback
+        self._requests = []
+        self._sizes = sizes
+
+    def add(self, request, request_id):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._sizes.append(len(self._requests))
+        # Deliver responses out of order, as the batch endpoint may
+        for request_id, request in reversed(self._requests):
+            if isinstance(request, Exception):
+                self._callback(request_id, None, request)
+            else:
+                self._callback(request_id, {'id': request}, None)
+
+def _slow_method(release):
+    """Resource method whose requests block until ``release`` is set."""
+    def slow(**kwargs):
+        request = MagicMock()
+        request.execute.side_effect = lambda: release.wait(5) and {'id': kwargs['id']}
+        return request
+    return slow
+
+def _fast_method(**kwargs):
+    """Resource method whose requests _FakeBatch answers with their ID."""
+    return kwargs['id']
+
+def _wait_until(condition, timeout=5):
+    """Poll ``condition`` until it holds, failing the test after ``timeout`` seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("Timed out waiting for the batch scheduler")
+        time.sleep(0.001)
+
+def test_execute_batch_chunks_and_preserves_order(fresh_server):
+    """Test batched execution is chunked and returns responses in request order."""
+    sizes = []
+    service = MagicMock()
+    service.new_batch_http_request.side_effect = lambda callback: _FakeBatch(callback, sizes)
+
+    responses = fresh_server._execute_batch(service, list(range(250)))
+
+    assert sizes == [100, 100, 50]
+    assert [r['id'] for r in responses] == list(range(250))
+
+    missing = LookupError("404 Not Found")
+    with pytest.raises(LookupError):
+        fresh_server._execute_batch(service, [1, missing, 3])
+    assert fresh_server._execute_batch(service, [1, missing, 3], return_exceptions=True) == [
+        {'id': 1}, missing, {'id': 3}]
+
+def test_batch_scheduler_coalesces_concurrent_calls():
+    """Test calls queued behind an in-flight call share one batch request."""
+    scheduler = _BatchScheduler()
+    release = threading.Event()
+    sizes = []
+    service = MagicMock()
+    service.new_batch_http_request.side_effect = lambda callback: _FakeBatch(callback, sizes)
+    slow = _slow_method(release)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        first = pool.submit(scheduler.execute, service, slow, {'id': 0})
+        _wait_until(lambda: scheduler._flushing)
+        rest = [pool.submit(scheduler.execute, service, _fast_method, {'id': i}) for i in range(1, 4)]
+        _wait_until(lambda: len(scheduler._pending) == 3)
+        release.set()
+
+        assert first.result(timeout=5) == {'id': 0}
+        assert [f.result(timeout=5) for f in rest] == [{'id': 1}, {'id': 2}, {'id': 3}]
+    assert sizes == [3]
+
+def test_batch_scheduler_isolates_request_build_errors():
+    """Test a call whose request cannot be built fails alone and the scheduler recovers."""
+    scheduler = _BatchScheduler()
+    release = threading.Event()
+    sizes = []
+    service = MagicMock()
+    service.new_batch_http_request.side_effect = lambda callback: _FakeBatch(callback, sizes)
+    slow = _slow_method(release)
+
+    def broken(**kwargs):
+        raise TypeError("bad argument")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+        first = pool.submit(scheduler.execute, service, slow, {'id': 0})
+        _wait_until(lambda: scheduler._flushing)
+        good = pool.submit(scheduler.execute, service, _fast_method, {'id': 1})
+        bad = pool.submit(scheduler.execute, service, broken, {'id': 2})
+        _wait_until(lambda: len(scheduler._pending) == 2)
+        release.set()
+
+        assert first.result(timeout=5) == {'id': 0}
+        assert good.result(timeout=5) == {'id': 1}
+        with pytest.raises(TypeError):
+            bad.result(timeout=5)
+    assert not scheduler._flushing
+    assert scheduler.execute(service, slow, {'id': 3}) == {'id': 3}
+
+def test_fetch_all_falls_back_to_individual_requests(fresh_server):
+    """Test calls are issued individually when the batch endpoint fails."""
+    service = MagicMock()
+    service.new_batch_http_request.return_value.execute.side_effect = OSError("batch unavailable")
+
+    def method(**kwargs):
+        request = MagicMock()
+        request.execute.return_value = {'id': kwargs['id']}
+        return request
+
+    async def _fetch():
+        return await fresh_server._call(fresh_server._fetch_all, service, method, [{'id': i} for i in range(5)])
+
+    responses = anyio.run(_fetch)
+
+    assert [r['id'] for r in responses] == list(range(5))
+
+def test_decode_body_data_across_chunks(monkeypatch):
+    """Test chunked decoding matches a one-shot decode, padded or not."""
+    monkeypatch.setattr('src.server.DECODE_CHUNK_SIZE', 8)
+    text = 'chunked ✓ body ' * 7
+    encoded = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+    assert _decode_body_data(encoded) == text
+    assert _decode_body_data(encoded.rstrip('=')) == text
+
+def test_save_token_is_atomic_and_skips_unchanged(tmp_path, monkeypatch, fresh_server):
+    """Test the token is replaced atomically and only rewritten when it changes."""
+    token_path = tmp_path / 'token.json'
+    monkeypatch.setattr('src.server.TOKEN_PATH', token_path)
+    monkeypatch.setattr('src.server._TOKEN_EXISTS', False)
+    creds = MagicMock()
+    creds.to_json.return_value = '{"token": "a"}'
+
+    fresh_server._save_token(creds)
+    fresh_server._token_writer.shutdown(wait=True)
+    assert token_path.read_text() == '{"token": "a"}'
+    assert not token_path.with_suffix('.tmp').exists()
+    assert src.server._TOKEN_EXISTS
+
+    token_path.write_text('stale')
+    fresh_server._save_token(creds)
+    assert token_path.read_text() == 'stale'
+
+@pytest.mark.skipif(os.name == 'nt', reason="POSIX file modes")
+def test_save_token_keeps_token_private(tmp_path, monkeypatch, fresh_server):
+    """Test a rewritten token keeps its mode and a new token is owner-only."""
+    token_path = tmp_path / 'token.json'
+    monkeypatch.setattr('src.server.TOKEN_PATH', token_path)
+    monkeypatch.setattr('src.server._TOKEN_EXISTS', False)
+    creds = MagicMock()
+
+    creds.to_json.return_value = '{"token": "a"}'
+    fresh_server._save_token(creds)
+    fresh_server._token_writer.shutdown(wait=True)
+    assert token_path.stat().st_mode & 0o777 == 0o600
+
+    token_path.chmod(0o640)
+    fresh_server._token_writer = concurrent.futures.ThreadPoolExecutor(1)
+    creds.to_json.return_value = '{"token": "b"}'
+    fresh_server._save_token(creds)
+    fresh_server._token_writer.shutdown(wait=True)
+    assert token_path.read_text() == '{"token": "b"}'
+    assert token_path.stat().st_mode & 0o777 == 0o640
+
+def test_save_token_retries_after_failed_write(tmp_path, monkeypatch, fresh_server):
+    """Test a token whose write failed is written again on the next save."""
+    token_path = tmp_path / 'missing' / 'token.json'
+    monkeypatch.setattr('src.server.TOKEN_PATH', token_path)
+    monkeypatch.setattr('src.server._TOKEN_EXISTS', False)
+    creds = MagicMock()
+    creds.to_json.return_value = '{"token": "a"}'
+
+    fresh_server._save_token(creds)
+    fresh_server._token_writer.shutdown(wait=True)
+    assert fresh_server._last_token_json is None
+
+    token_path.parent.mkdir()
+    fresh_server._token_writer = concurrent.futures.ThreadPoolExecutor(1)
+    fresh_server._save_token(creds)
+    fresh_server._token_writer.shutdown(wait=True)
+    assert token_path.read_text() == '{"token": "a"}'
+
+def _part(mime_type, text=None, parts=None):
+    part = {'mimeType': mime_type, 'body': {}}
+    if text is not None:
+        part['body']['data'] = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+    if parts is not None:
+        part['parts'] = parts
+    return part
+
+def test_extract_message_body_prefers_nested_plain_text(server):
+    """Test plain text is found in nested multiparts ahead of earlier HTML."""
+    payload = _part('multipart/mixed', parts=[
+        _part('text/html', '<p>html</p>'),
+        _part('multipart/alternative', parts=[_part('text/plain', 'plain ✓')]),
+        _part('application/pdf', 'ignored'),
+    ])
+    assert server._extract_message_body(payload) == 'plain ✓'
+
+def test_extract_message_body_falls_back_to_html(server):
+    """Test the first HTML body is returned when there is no plain text."""
+    payload = _part('multipart/alternative', parts=[
+        _part('text/html', '<p>first</p>'),
+        _part('text/html', '<p>second</p>'),
+    ])
+    assert server._extract_message_body(payload) == '<p>first</p>'
+    assert server._extract_message_body(_part('image/png', 'x')) == ''
+
+def _use_service(server, service):
+    """Install a mock Gmail service as if it had been built and cached."""
+    server._creds = MagicMock(valid=True)
+    server._service = service
+    server._messages_api = service.users().messages()
+    server._drafts_api = service.users().drafts()
+
+def test_gmail_service_reused_after_refresh(monkeypatch, fresh_server):
+    """Test expired cached credentials are refreshed without rebuilding the service."""
+    service = MagicMock()
+    _use_service(fresh_server, service)
+    fresh_server._creds.valid = False
+    fresh_server._creds.expired = True
+
+    def _refresh(request):
+        fresh_server._creds.valid = True
+    fresh_server._creds.refresh.side_effect = _refresh
+    monkeypatch.setattr(fresh_server, '_save_token', lambda creds: None)
+    monkeypatch.setattr('src.server.build_from_document', MagicMock(side_effect=AssertionError("rebuilt")))
+
+    assert fresh_server._get_gmail_service() is service
+    fresh_server._creds.refresh.assert_called_once()
+
+def test_email_content_is_cached_by_message_id(fresh_server):
+    """Test a message body is fetched once and then served from the cache."""
+    service = MagicMock()
+    service.users().messages().get().execute.return_value = {'payload': _part('text/plain', 'cached body')}
+    _use_service(fresh_server, service)
+
+    async def _read_twice():
+        return [await fresh_server.mcp.call_tool("get_email_content", {"message_id": "abc"}) for _ in range(2)]
+
+    service.users().messages().get.reset_mock()
+    first, second = anyio.run(_read_twice)
+    assert first == second
+    assert 'cached body' in str(first)
+    assert service.users().messages().get.call_count == 1
+
+def test_list_responses_are_cached_briefly(monkeypatch, fresh_server):
+    """Test repeated list reads within the TTL reuse the formatted response."""
+    service = MagicMock()
+    _use_service(fresh_server, service)
+    lists = []
+
+    def _execute(service, method, kwargs):
+        lists.append(kwargs)
+        return {}
+    fresh_server._batch_scheduler.execute = _execute
+
+    async def _read(uri):
+        return await fresh_server.mcp.read_resource(uri)
+
+    first = anyio.run(_read, "gmail://sent/5")
+    assert anyio.run(_read, "gmail://sent/5") == first
+    assert len(lists) == 1
+
+    monkeypatch.setattr(src.server, 'RESPONSE_CACHE_TTL', -1.0)
+    fresh_server._response_cache.clear()
+    anyio.run(_read, "gmail://sent/5")
+    anyio.run(_read, "gmail://sent/5")
+    assert len(lists) == 3
+
+def test_get_messages_batch_fetches_uncached_bodies_together(fresh_server):
+    """Test bodies come from the cache plus one batched fetch, with failures shown per ID."""
+    _use_service(fresh_server, MagicMock())
+    fresh_server._body_cache['m1'] = 'cached body'
+    fresh_server._messages_api.get = lambda **kwargs: kwargs['id']
+    batches = []
+
+    def _execute_batch(service, requests, return_exceptions=False):
+        batches.append(requests)
+        assert return_exceptions
+        return [Exception("404 Not Found") if r == 'gone' else {'payload': _part('text/plain', f'body of {r}')}
+                for r in requests]
+    fresh_server._execute_batch = _execute_batch
+
+    async def _call():
+        return await fresh_server.mcp.call_tool(
+            "get_messages_batch", {"message_ids": ["m1", "m2", "gone", "m3", "m2"], "fmt": "full"})
+
+    result = str(anyio.run(_call))
+    assert batches == [['m2', 'gone', 'm3']]
+    assert result.index('cached body') < result.index('body of m2') < result.index('body of m3')
+    assert 'Message ID: gone\\nError: 404 Not Found' in result
+    assert fresh_server._body_cache['m3'] == 'body of m3'
+    assert 'gone' not in fresh_server._body_cache
+
+    # Fully cached requests never reach the worker pool
+    fresh_server._call = MagicMock(side_effect=AssertionError("fetched"))
+    assert 'cached body' in str(anyio.run(lambda: fresh_server.mcp.call_tool(
+        "get_messages_batch", {"message_ids": ["m1", "m3"], "fmt": "full"})))
+
+def test_get_messages_batch_caps_message_ids(fresh_server):
+    """Test a call with too many IDs is refused before touching the API."""
+    fresh_server._call = MagicMock(side_effect=AssertionError("fetched"))
+    ids = [f"m{i}" for i in range(src.server.MAX_BATCH_MESSAGE_IDS + 1)]
+
+    result = str(anyio.run(lambda: fresh_server.mcp.call_tool("get_messages_batch", {"message_ids": ids})))
+
+    assert 'Too many message IDs' in result
+
+def test_search_emails_ids_only_skips_metadata(fresh_server):
+    """Test ids_only returns the listed IDs without fetching metadata."""
+    _use_service(fresh_server, MagicMock())
+    fresh_server._list_messages = lambda service, max_results, **kwargs: [{'id': 'm1'}, {'id': 'm2'}]
+    fresh_server._fetch_all = MagicMock(side_effect=AssertionError("fetched"))
+
+    async def _search(ids_only):
+        return await fresh_server.mcp.call_tool(
+            "search_emails", {"query": "is:unread", "ids_only": ids_only})
+
+    assert 'm1\\nm2' in str(anyio.run(_search, True))
+    # The full listing is cached separately and still fetches metadata
+    assert 'fetched' in str(anyio.run(_search, False))
+
+def test_format_messages_matches_headers_case_insensitively(fresh_server):
+    """Test header names are matched regardless of casing, with defaults for missing ones."""
+    service = MagicMock()
+    _use_service(fresh_server, service)
+    fresh_server._messages_api.get = lambda **kwargs: kwargs['id']
+    headers = [{'name': 'subject', 'value': 'Hello'}, {'name': 'FROM', 'value': 'a@example.com'}]
+    fresh_server._execute_batch = lambda svc, requests, return_exceptions=False: [
+        {'payload': {'headers': headers}} for _ in requests]
+
+    formatted = fresh_server._format_messages(service, [{'id': 'm1'}])
+
+    assert formatted.startswith(
+        "Message ID: m1\nFrom: a@example.com\nTo: No Recipient\nDate: Unknown Date\nSubject: Hello\n"
+    )
+
+def test_list_paged_follows_page_tokens(fresh_server):
+    """Test list results are collected across pages up to max_results."""
+    pages = {None: {'messages': [{'id': '1'}, {'id': '2'}], 'nextPageToken': 't2'},
+             't2': {'messages': [{'id': '3'}, {'id': '4'}], 'nextPageToken': 't3'}}
+    calls = []
+
+    def _execute(service, method, kwargs):
+        calls.append(kwargs)
+        return pages[kwargs.get('pageToken')]
+    fresh_server._batch_scheduler.execute = _execute
+
+    messages = fresh_server._list_paged(MagicMock(), None, 'messages', 3, q='is:unread')
+
+    assert [m['id'] for m in messages] == ['1', '2', '3']
+    assert [c['maxResults'] for c in calls] == [3, 1]
+    assert all(c['q'] == 'is:unread' for c in calls)
+
+@pytest.mark.skipif(src.server.orjson is None, reason="orjson not installed")
+def test_orjson_model_matches_json_model():
+    """Test the orjson response model parses bodies like googleapiclient's own."""
+    model = src.server._OrjsonModel()
+    assert model.deserialize(b'{"messages": [{"id": "1"}]}') == {'messages': [{'id': '1'}]}
+    assert model.deserialize(b'') == ''
+    assert model.serialize({'raw': 'abc'}) == '{"raw":"abc"}'
+
+@pytest.mark.skipif(src.server.isal_zlib is None, reason="isal not installed")
+def test_isal_decompresses_gzip_responses():
+    """Test httplib2 still decodes gzip and raw deflate bodies with ISA-L swapped in."""
+    import gzip
+    import zlib
+    import httplib2
+    body = b'{"messages": []}' * 100
+    deflate = zlib.compressobj(wbits=-15)
+    for encoding, content in [('gzip', gzip.compress(body)),
+                              ('deflate', deflate.compress(body) + deflate.flush())]:
+        response = httplib2.Response({'status': 200, 'content-encoding': encoding})
+        assert httplib2._decompressContent(response, content, {}) == body
+
+def test_build_raw_message_round_trips():
+    """Test composed messages parse back to the original fields."""
+    body = 'Body ✓\n' + 'x' * 2000
+    raw = _build_raw_message('Zoë <zoe@example.com>', 'Grüße', body)
+    raw = base64.urlsafe_b64decode(raw)
+    assert b'\n' not in raw.replace(b'\r\n', b'')
+    assert max(len(line) for line in raw.split(b'\r\n')) <= 76
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    assert message['To'] == 'Zoë <zoe@example.com>'
+    assert message['Subject'] == 'Grüße'
+    assert message.get_content() == body
+
+    with pytest.raises(ValueError):
+        _build_raw_message('a@example.com', 'Hi\r\nBcc: x@example.com', 'body')
+
+def test_build_raw_message_encodes_long_and_non_ascii_headers():
+    """Test folded subjects keep CRLF line endings and non-ASCII addresses are encoded."""
+    subject = 'Grüße ' * 30
+    raw = base64.urlsafe_b64decode(_build_raw_message('Jörg <jörg@exämple.com>', subject, 'body'))
+    header_block = raw.split(b'\r\n\r\n', 1)[0]
+    assert b'\n' not in header_block.replace(b'\r\n', b'')
+    message = BytesParser(policy=policy.default).parsebytes(raw)
+    assert message['Subject'] == subject
+    # An address that is itself non-ASCII is encoded as a whole, as MIMEText did
+    to = BytesParser().parsebytes(raw)['To']
+    assert to.isascii()
+    assert str(make_header(decode_header(to))) == 'Jörg <jörg@exämple.com>'